@@ -0,0 +1,77 @@
+# ============================================================
+#         coconut_constants.py (shared model constants)
+# ============================================================
+#
+# Model files, input geometry and class tables shared by render.py,
+# convert_model.py and gunicorn_conf.py. Tables are tuples / read-only mappings.
+
+import os
+from types import MappingProxyType
+import numpy as np
+
+# ---------------- HOST ----------------
+# Cores this process may run on (respects CPU affinity / container cpusets)
+CPU_COUNT = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+
+# ---------------- MODEL FILES ----------------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(BASE_DIR, "cnn_model4.h5")
+ONNX_MODEL_PATH = os.path.join(BASE_DIR, "cnn_model4.onnx")
+SAVED_MODEL_PATH = os.path.join(BASE_DIR, "cnn_model4_savedmodel")  # built by convert_model.py
+TFLITE_MODEL_PATH = os.path.join(BASE_DIR, "cnn_model4_int8.tflite")  # built by convert_model.py
+
+# ---------------- INPUT ----------------
+IMG_SIZE = (224, 224)  # (width, height), as cv2.resize expects
+INPUT_SHAPE = (IMG_SIZE[1], IMG_SIZE[0], 3)  # model input, without the batch axis
+INV_255 = np.float32(1.0 / 255.0)
+
+# ---------------- CLASSES ----------------
+# lower to allow predictions even if slightly uncertain. Kept at the deployed
+# 0.4 rather than 0.6: raising it would turn predictions clients get today
+# into "Low Confidence" results that are not saved.
+CONFIDENCE_THRESHOLD = 0.4
+
+CLASSES = (
+    "Baybay Tall Coconut",
+    "Catigan Dwarf Coconut",
+    "Laguna Tall Coconut",
+    "Tacunan Dwarf Coconut",
+    "NotCoconut",
+    "Unknown Dwarf Variety",
+    "Unknown Tall Variety"
+)
+
+NOT_COCONUT_INDEX = CLASSES.index("NotCoconut")
+
+# Labels the model can emit that are not a recognised coconut variety
+INVALID_CLASSES = frozenset({"NotCoconut", "Unknown Dwarf Variety", "Unknown Tall Variety"})
+
+CLASS_INFO = MappingProxyType({
+    "Baybay Tall Coconut": {
+        "class_name": "Baybay Tall Coconut",
+        "lifespan": "60–90 years",
+        "definition": "Tall coconut variety with strong trunk and high yield."
+    },
+    "Catigan Dwarf Coconut": {
+        "class_name": "Catigan Dwarf Coconut",
+        "lifespan": "60–90 years",
+        "definition": "Dwarf variety known for early fruiting."
+    },
+    "Laguna Tall Coconut": {
+        "class_name": "Laguna Tall Coconut",
+        "lifespan": "60–90 years",
+        "definition": "Tall variety adaptable to different environments."
+    },
+    "Tacunan Dwarf Coconut": {
+        "class_name": "Tacunan Dwarf Coconut",
+        "lifespan": "60–90 years",
+        "definition": "Compact dwarf coconut with quality nuts."
+    }
+})
+
+# Per-class columns aligned with CLASSES, so a prediction is described by
+# its argmax index instead of dict lookups
+UNKNOWN_INFO = MappingProxyType({"lifespan": "Unknown", "definition": "No info available"})
+CLASS_LIFESPANS = tuple(CLASS_INFO.get(c, UNKNOWN_INFO)["lifespan"] for c in CLASSES)
+CLASS_DEFINITIONS = tuple(CLASS_INFO.get(c, UNKNOWN_INFO)["definition"] for c in CLASSES)
+CLASS_IS_VALID = tuple(c not in INVALID_CLASSES for c in CLASSES)
@@ -0,0 +1,107 @@
+# ============================================================
+#          convert_model.py (offline model conversion)
+# ============================================================
+#
+# tflite: quantizes cnn_model4.h5 to a full-integer (int8) TFLite
+# model. Activations are calibrated on real coconut photos, so point
+# it at a folder of ~100 representative images:
+#
+#   python convert_model.py tflite path/to/sample_images [num_samples]
+#
+# The result is written as cnn_model4_int8.tflite and picked up by
+# render.py with INFERENCE_BACKEND=tflite.
+#
+# savedmodel: exports cnn_model4.h5 as a TensorFlow SavedModel, which
+# the Keras backend loads in preference to the .h5 (faster cold start):
+#
+#   python convert_model.py savedmodel
+#
+# onnx: exports cnn_model4.h5 to cnn_model4.onnx (needs tf2onnx) for
+# render.py with INFERENCE_BACKEND=onnx:
+#
+#   python convert_model.py onnx
+
+import os
+import sys
+import cv2
+import numpy as np
+import tensorflow as tf
+from coconut_constants import (
+    MODEL_PATH, ONNX_MODEL_PATH, SAVED_MODEL_PATH, TFLITE_MODEL_PATH, IMG_SIZE, INPUT_SHAPE, INV_255
+)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def calibration_images(image_dir, limit):
+    names = sorted(n for n in os.listdir(image_dir) if n.lower().endswith(IMAGE_EXTENSIONS))
+    if not names:
+        raise SystemExit(f"No images found in {image_dir}")
+    return [os.path.join(image_dir, n) for n in names[:limit]]
+
+
+def representative_dataset(paths):
+    def gen():
+        for path in paths:
+            # Same decode/resize as render.py so calibration sees serving inputs
+            img = cv2.imread(path, cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+            if img is None:
+                print(f"⚠️ Skipping unreadable image {path}")
+                continue
+            img = cv2.resize(img, IMG_SIZE, interpolation=cv2.INTER_AREA)
+            rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+            yield [np.multiply(rgb, INV_255, dtype=np.float32).reshape((1,) + rgb.shape)]
+    return gen
+
+
+def convert_tflite(image_dir, limit=100):
+    model = tf.keras.models.load_model(MODEL_PATH)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset(calibration_images(image_dir, limit))
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.uint8
+    converter.inference_output_type = tf.uint8
+
+    with open(TFLITE_MODEL_PATH, "wb") as f:
+        f.write(converter.convert())
+    print(f"✅ Wrote {TFLITE_MODEL_PATH}")
+
+
+def convert_savedmodel():
+    model = tf.keras.models.load_model(MODEL_PATH)
+    if hasattr(model, "export"):  # Keras 3
+        model.export(SAVED_MODEL_PATH)
+    else:
+        tf.saved_model.save(model, SAVED_MODEL_PATH)
+    print(f"✅ Wrote {SAVED_MODEL_PATH}")
+
+
+def convert_onnx():
+    import tf2onnx
+
+    model = tf.keras.models.load_model(MODEL_PATH)
+    spec = (tf.TensorSpec((None,) + INPUT_SHAPE, tf.float32, name="input"),)
+    # Written next to the target and renamed into place, so a running server
+    # never opens a half-written file
+    tmp_path = ONNX_MODEL_PATH + ".tmp"
+    tf2onnx.convert.from_keras(model, input_signature=spec, output_path=tmp_path)
+    os.replace(tmp_path, ONNX_MODEL_PATH)
+    print(f"✅ Wrote {ONNX_MODEL_PATH}")
+
+
+USAGE = (
+    "Usage: python convert_model.py tflite <calibration_image_dir> [num_samples]\n"
+    "       python convert_model.py savedmodel\n"
+    "       python convert_model.py onnx"
+)
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "tflite":
+        convert_tflite(sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 100)
+    elif len(sys.argv) == 2 and sys.argv[1] == "savedmodel":
+        convert_savedmodel()
+    elif len(sys.argv) == 2 and sys.argv[1] == "onnx":
+        convert_onnx()
+    else:
+        raise SystemExit(USAGE)
@@ -0,0 +1,38 @@
+# ============================================================
+#                 gunicorn_conf.py (production)
+# ============================================================
+#
+#   gunicorn -c gunicorn_conf.py render:app
+#
+# The app module is imported once in the master and forked into the
+# workers. TensorFlow's thread pools do not survive fork, so each worker
+# loads the CNN itself right after forking (see post_fork).
+
+import os
+from coconut_constants import CPU_COUNT
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", max(2, CPU_COUNT // 2)))
+threads = int(os.environ.get("GUNICORN_THREADS", 16))
+timeout = 30
+preload_app = True
+
+# A worker's batches are built from its own in-flight requests, so they can
+# never be larger than its thread count (for the same reason render.py's
+# batch queue bound never fills under gunicorn)
+os.environ["MAX_BATCH"] = str(min(int(os.environ.get("MAX_BATCH", threads)), threads))
+
+# Split the cores between workers instead of every worker claiming all of
+# them; render.py applies this to TensorFlow, OpenMP, ONNX Runtime and TFLite
+os.environ.setdefault("TF_NUM_INTRAOP_THREADS", str(max(1, CPU_COUNT // workers)))
+os.environ.setdefault("DEFER_MODEL_LOAD", "1")
+
+
+def post_fork(server, worker):
+    import render
+    render.ensure_background_thread(render.preload_model)
+
+
+def worker_exit(server, worker):
+    import render
+    render.flush_predictions()
@@ -4,63 +4,133 @@
 
 import os
 import io
+import mmap
+import tempfile
+from coconut_constants import CPU_COUNT
+
+# ---------------- TENSORFLOW CPU TUNING ----------------
+# Must be set before TensorFlow is imported. setdefault keeps any values
+# configured on the host.
+os.environ.setdefault("TF_ENABLE_ONEDNN_OPS", "1")  # oneDNN conv/bias/relu fusions
+os.environ.setdefault("TF_NUM_INTRAOP_THREADS", str(CPU_COUNT))
+os.environ.setdefault("TF_NUM_INTEROP_THREADS", "1")
+os.environ.setdefault("OMP_NUM_THREADS", os.environ["TF_NUM_INTRAOP_THREADS"])
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")  # keep C++ errors, drop info/warning chatter
+
+# OpenCV decodes anything up to 2^30 pixels, so a small upload declaring huge
+# dimensions could allocate gigabytes. Cap it like Pillow's decompression bomb
+# check did before (decode_image treats bigger images as invalid).
+os.environ.setdefault("OPENCV_IO_MAX_IMAGE_PIXELS", str(50_000_000))
+
 import json
-from PIL import Image
-from flask import Flask, request, jsonify, render_template
+import time
+import atexit
+import hashlib
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import cv2
+import orjson
+from flask import Flask, Request, Response, request, jsonify
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
 from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing import image as keras_image
 import numpy as np
+import tensorflow as tf
 import firebase_admin
 from firebase_admin import credentials, firestore
+from coconut_constants import (
+    MODEL_PATH, SAVED_MODEL_PATH, ONNX_MODEL_PATH, TFLITE_MODEL_PATH,
+    IMG_SIZE, INPUT_SHAPE, INV_255, CONFIDENCE_THRESHOLD,
+    CLASSES, NOT_COCONUT_INDEX, CLASS_INFO, UNKNOWN_INFO, CLASS_LIFESPANS, CLASS_DEFINITIONS, CLASS_IS_VALID,
+)
+
+# Per-process compute threads; gunicorn_conf.py lowers this when running several workers
+INTRAOP_THREADS = int(os.environ["TF_NUM_INTRAOP_THREADS"])
+tf.config.threading.set_intra_op_parallelism_threads(INTRAOP_THREADS)
+tf.config.threading.set_inter_op_parallelism_threads(int(os.environ["TF_NUM_INTEROP_THREADS"]))
+tf.get_logger().setLevel("ERROR")
+
+# Request threads decode and resize images concurrently, so OpenCV's own
+# worker pool would only compete with them and with TensorFlow for cores
+cv2.setNumThreads(int(os.environ.get("OPENCV_NUM_THREADS", 1)))
 
 # ---------------- PATHS ----------------
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-MODEL_PATH = os.path.join(BASE_DIR, "cnn_model4.h5")
 TEMPLATE_DIR = os.path.join(BASE_DIR, "templates")
 STATIC_DIR = os.path.join(BASE_DIR, "static")
 
 # ---------------- FLASK APP ----------------
+class ORJSONProvider(JSONProvider):
+    # orjson for jsonify() and request.get_json(); responses skip the str round trip
+    OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=self.OPTIONS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, option=self.OPTIONS), mimetype="application/json")
+
+MAX_UPLOAD_BYTES = 8 * 1024 * 1024
+UPLOAD_SPOOL_BYTES = 512 * 1024
+
+class UploadRequest(Request):
+    # Small uploads are kept in a BytesIO and decoded from its buffer; larger
+    # ones go to an unnamed temp file that is memory-mapped for decoding, so
+    # they never sit in the worker's heap
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if total_content_length is not None and total_content_length <= UPLOAD_SPOOL_BYTES:
+            return io.BytesIO()
+        return tempfile.TemporaryFile("rb+")
+
 app = Flask(__name__, template_folder=TEMPLATE_DIR, static_folder=STATIC_DIR)
+app.request_class = UploadRequest
+app.json = ORJSONProvider(app)
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES
+app.config["SEND_FILE_MAX_AGE_DEFAULT"] = 86400  # /static responses are already conditional
 CORS(app)
 
+@app.errorhandler(413)
+def upload_too_large(e):
+    return jsonify({"error": f"Upload exceeds {MAX_UPLOAD_BYTES // (1024 * 1024)} MB"}), 413
+
+@app.errorhandler(queue.Full)
+def prediction_queue_full(e):
+    return jsonify({"error": "Server busy, please retry"}), 503
+
+class ModelNotLoaded(RuntimeError):
+    pass
+
+@app.errorhandler(ModelNotLoaded)
+@app.errorhandler(TimeoutError)  # also concurrent.futures.TimeoutError
+def prediction_unavailable(e):
+    return jsonify({"error": "Model unavailable, please retry"}), 503
+
 # ---------------- MODEL ----------------
-model = None
-IMG_SIZE = (224, 224)
-CONFIDENCE_THRESHOLD = 0.4  # lower to allow predictions even if slightly uncertain
-
-CLASSES = [
-    "Baybay Tall Coconut",
-    "Catigan Dwarf Coconut",
-    "Laguna Tall Coconut",
-    "Tacunan Dwarf Coconut",
-    "NotCoconut",
-    "Unknown Dwarf Variety",
-    "Unknown Tall Variety"
-]
-
-CLASS_INFO = {
-    "Baybay Tall Coconut": {
-        "class_name": "Baybay Tall Coconut",
-        "lifespan": "60–90 years",
-        "definition": "Tall coconut variety with strong trunk and high yield."
-    },
-    "Catigan Dwarf Coconut": {
-        "class_name": "Catigan Dwarf Coconut",
-        "lifespan": "60–90 years",
-        "definition": "Dwarf variety known for early fruiting."
-    },
-    "Laguna Tall Coconut": {
-        "class_name": "Laguna Tall Coconut",
-        "lifespan": "60–90 years",
-        "definition": "Tall variety adaptable to different environments."
-    },
-    "Tacunan Dwarf Coconut": {
-        "class_name": "Tacunan Dwarf Coconut",
-        "lifespan": "60–90 years",
-        "definition": "Compact dwarf coconut with quality nuts."
-    }
-}
+# "keras" runs the .h5 graph (or its SavedModel export) directly; "onnx"
+# serves its ONNX export through ONNX Runtime; "tflite" runs the
+# int8-quantized model. The exports are produced by convert_model.py
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "keras").lower()
+
+model = None  # callable: uint8 BGR batch (N, 224, 224, 3) -> class scores (N, len(CLASSES))
+model_ready = threading.Event()
+MODEL_LOAD_TIMEOUT = 120  # seconds a /predict request waits for a cold worker's model
+
+# Concurrent /predict calls are coalesced into one forward pass of up to
+# MAX_BATCH images; a lone request waits at most MAX_WAIT_MS for company.
+MAX_BATCH = int(os.environ.get("MAX_BATCH", 16))
+MAX_WAIT_MS = float(os.environ.get("MAX_WAIT_MS", 5))
+PREDICT_TIMEOUT = 30  # seconds a request waits for its batch result
+# Backlog beyond this gets a 503. Only the threaded dev server can reach it:
+# a gunicorn worker never has more than `threads` requests in flight, fewer
+# than MAX_BATCH * MAX_QUEUED_BATCHES, and excess connections wait in
+# gunicorn's listen backlog instead.
+MAX_QUEUED_BATCHES = int(os.environ.get("MAX_QUEUED_BATCHES", 4))
 
 # ---------------- FIREBASE INIT ----------------
 db = None
@@ -77,68 +147,512 @@ try:
 except Exception as e:
     print("⚠️ Firebase init failed:", e)
 
-# ---------------- IMAGE HELPERS ----------------
-def load_image_from_file(file):
-    return Image.open(io.BytesIO(file.read())).convert("RGB")
+# ---------------- BACKGROUND THREADS ----------------
+background_threads = {}
+background_threads_lock = threading.Lock()
 
-def preprocess_image(img):
-    img = img.resize(IMG_SIZE)
-    arr = keras_image.img_to_array(img) / 255.0
-    return arr[np.newaxis, ...]
+def ensure_background_thread(target):
+    # Started on first use so each (possibly forked) worker process owns its threads
+    thread = background_threads.get(target)
+    if thread is None or not thread.is_alive():
+        with background_threads_lock:
+            thread = background_threads.get(target)
+            if thread is None or not thread.is_alive():
+                thread = threading.Thread(target=target, daemon=True)
+                thread.start()
+                background_threads[target] = thread
 
-def predict_image(img):
+def drain_queue(q, limit, wait_seconds):
+    # Block for the first item, then collect more until `limit` items or the deadline
+    items = [q.get()]
+    deadline = time.monotonic() + wait_seconds
+    while len(items) < limit:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            items.append(q.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return items
+
+# ---------------- FIRESTORE WRITER ----------------
+# Predictions are saved off the request path: a writer thread drains the
+# queue and commits up to WRITE_BATCH_SIZE documents per Firestore batch
+# (the API allows 500), with WRITE_WORKERS commits in flight at once.
+# Both the queue and the in-flight commits are bounded, so a Firestore
+# outage drops new predictions with a warning instead of growing memory.
+# Whatever is still queued is committed when the process exits.
+WRITE_BATCH_SIZE = 400
+WRITE_FLUSH_SECONDS = 0.5
+WRITE_MAX_RETRIES = 5
+WRITE_WORKERS = 10
+WRITE_QUEUE_SIZE = 10000
+WRITE_SHUTDOWN_SECONDS = 20  # within gunicorn's 30 s graceful_timeout
+
+write_queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+write_executor = ThreadPoolExecutor(max_workers=WRITE_WORKERS)
+write_slots = threading.BoundedSemaphore(WRITE_WORKERS * 2)
+
+def commit_predictions(items):
+    try:
+        for attempt in range(WRITE_MAX_RETRIES):
+            try:
+                batch = db.batch()
+                collection = db.collection("CoconutPredictions")
+                for item in items:
+                    batch.set(collection.document(), item)
+                batch.commit()
+                return
+            except Exception as e:
+                print(f"⚠️ Firestore write failed (attempt {attempt + 1}):", e)
+                if attempt + 1 < WRITE_MAX_RETRIES:
+                    time.sleep(0.2 * 2 ** attempt)
+        print(f"⚠️ Dropped {len(items)} predictions after {WRITE_MAX_RETRIES} attempts")
+    finally:
+        write_slots.release()
+
+def firestore_writer():
+    while True:
+        items = drain_queue(write_queue, WRITE_BATCH_SIZE, WRITE_FLUSH_SECONDS)
+        stopping = None in items  # queued by flush_predictions after everything else
+        items = [item for item in items if item is not None]
+        if items:
+            write_slots.acquire()
+            write_executor.submit(commit_predictions, items)
+        if stopping:
+            return
+
+def flush_predictions():
+    # Runs at worker exit (gunicorn_conf.py worker_exit, or atexit): lets the
+    # writer hand off everything queued, then waits for the commits to finish
+    writer = background_threads.get(firestore_writer)
+    if writer is not None and writer.is_alive():
+        try:
+            write_queue.put(None, timeout=WRITE_SHUTDOWN_SECONDS)
+            writer.join(WRITE_SHUTDOWN_SECONDS)
+        except queue.Full:
+            print("⚠️ Firestore write queue full at shutdown, queued predictions not saved")
+    write_executor.shutdown(wait=True)
+
+atexit.register(flush_predictions)
+
+def save_prediction(result):
+    if db is None:
+        return
+    ensure_background_thread(firestore_writer)
+    try:
+        write_queue.put_nowait(dict(result))
+    except queue.Full:
+        print("⚠️ Firestore write queue full, prediction not saved")
+
+# ---------------- INFERENCE BACKENDS ----------------
+def load_forward_fn():
+    # A SavedModel export (convert_model.py savedmodel) restores the traced
+    # graph directly, skipping the HDF5 parse and Keras layer rebuild. When
+    # the export exists it is always used, even if cnn_model4.h5 is newer,
+    # so re-run the export after replacing the .h5.
+    if os.path.isdir(SAVED_MODEL_PATH):
+        if os.path.exists(MODEL_PATH) and os.path.getmtime(MODEL_PATH) > os.path.getmtime(SAVED_MODEL_PATH):
+            print("⚠️ cnn_model4.h5 is newer than its SavedModel export; serving the export")
+        # The signature only holds weak references to the restored variables,
+        # so the loaded root must stay referenced by the returned function
+        loaded = tf.saved_model.load(SAVED_MODEL_PATH)
+        serving = loaded.signatures["serving_default"]
+        input_name = next(iter(serving.structured_input_signature[1]))
+
+        def forward(x, loaded=loaded):
+            return next(iter(serving(**{input_name: x}).values()))
+        return forward
+
+    keras_model = load_model(MODEL_PATH)
+    return lambda x: keras_model(x, training=False)
+
+def load_keras_backend():
+    model_fn = load_forward_fn()
+
+    # XLA-compiled forward pass; bypasses Keras predict()'s per-call machinery.
+    # Takes raw uint8 BGR pixels so the channel flip and /255 scaling fuse
+    # into the first conv. Traced once into a concrete function, so calls
+    # skip tf.function's signature matching and trace-cache lookup.
+    @tf.function(
+        input_signature=[tf.TensorSpec((None,) + INPUT_SHAPE, tf.uint8)],
+        jit_compile=True,
+    )
+    def forward(x):
+        return model_fn(tf.cast(tf.reverse(x, axis=[-1]), tf.float32) * INV_255)
+
+    infer = forward.get_concrete_function()
+
+    def run(x):
+        # XLA compiles once per batch size, so pad batches up to a power of two
+        n = len(x)
+        size = 1 << (n - 1).bit_length()
+        if size != n:
+            x = np.concatenate([x, np.zeros((size - n,) + x.shape[1:], dtype=x.dtype)])
+        return infer(tf.constant(x)).numpy()[:n]
+
+    return run
+
+def load_onnx_backend():
+    # onnxruntime is only needed for this backend
+    import onnxruntime as ort
+
+    if not os.path.exists(ONNX_MODEL_PATH):
+        raise FileNotFoundError(f"{ONNX_MODEL_PATH} not found; run: python convert_model.py onnx")
+
+    # TensorRT / CUDA are used when the host has them, otherwise the CPU provider
+    preferred = ["TensorrtExecutionProvider", "CUDAExecutionProvider", "CPUExecutionProvider"]
+    available = ort.get_available_providers()
+    providers = [p for p in preferred if p in available]
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = INTRAOP_THREADS
+    options.inter_op_num_threads = 1
+    session = ort.InferenceSession(ONNX_MODEL_PATH, sess_options=options, providers=providers)
+    input_name = session.get_inputs()[0].name
+    print("✅ ONNX Runtime session ready:", session.get_providers())
+    # x[..., ::-1] is a view, so BGR->RGB happens within the scaling pass
+    return lambda x: session.run(None, {input_name: np.multiply(x[..., ::-1], INV_255, dtype=np.float32)})[0]
+
+def load_tflite_backend():
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        Interpreter = tf.lite.Interpreter
+
+    interpreter = Interpreter(model_path=TFLITE_MODEL_PATH, num_threads=INTRAOP_THREADS)
+    interpreter.allocate_tensors()
+    input_detail = interpreter.get_input_details()[0]
+    output_detail = interpreter.get_output_details()[0]
+    in_scale, in_zero = input_detail["quantization"]
+    out_scale, out_zero = output_detail["quantization"]
+    in_dtype = input_detail["dtype"]
+    in_range = np.iinfo(in_dtype) if np.issubdtype(in_dtype, np.integer) else None
+    # A uint8 input calibrated to [0, 1] with scale 1/255 takes the raw pixels as-is
+    pixels_in = in_dtype == np.uint8 and in_zero == 0 and np.isclose(in_scale, 1.0 / 255.0)
+    lock = threading.Lock()  # an Interpreter must not be invoked from two threads at once
+
+    def run(x):
+        x = x[..., ::-1]  # BGR -> RGB view, materialized by the conversions below
+        if pixels_in:
+            x = np.ascontiguousarray(x)
+        elif in_scale:
+            # Map pixel / 255 onto the calibrated integer range
+            x = np.round(x * (INV_255 / in_scale) + in_zero)
+            if in_range is not None:
+                np.clip(x, in_range.min, in_range.max, out=x)
+        else:
+            x = x * INV_255
+        x = x.astype(in_dtype, copy=False)
+        # The interpreter stays allocated for a single image: resizing its input
+        # for every batch size would reallocate all tensors, so batches are
+        # run image by image (XNNPACK int8 kernels are tuned for batch 1)
+        preds = np.empty((len(x),) + tuple(output_detail["shape"][1:]), dtype=output_detail["dtype"])
+        with lock:
+            for i in range(len(x)):
+                interpreter.set_tensor(input_detail["index"], x[i:i + 1])
+                interpreter.invoke()
+                preds[i] = interpreter.get_tensor(output_detail["index"])[0]
+        if out_scale:
+            preds = (preds.astype(np.float32) - out_zero) * out_scale
+        return preds
+
+    print("✅ TFLite int8 interpreter ready")
+    return run
+
+INFERENCE_BACKENDS = {
+    "keras": load_keras_backend,
+    "onnx": load_onnx_backend,
+    "tflite": load_tflite_backend,
+}
+
+def load_inference_model():
+    loader = INFERENCE_BACKENDS.get(INFERENCE_BACKEND, load_keras_backend)
+    try:
+        return loader()
+    except Exception as e:
+        if loader is load_keras_backend:
+            raise
+        print(f"⚠️ {INFERENCE_BACKEND} backend failed, falling back to Keras:", e)
+        return load_keras_backend()
+
+def preload_model():
     global model
-    if model is None:
+    if model_ready.is_set():
+        return
+    try:
         print("📦 Loading CNN model...")
-        model = load_model(MODEL_PATH)
+        loaded = load_inference_model()
+        # Dummy passes trace/compile the graph and pick kernels before real
+        # traffic, for every padded batch size the batcher can produce (up to
+        # MAX_BATCH, which gunicorn_conf.py caps at the worker's thread count)
+        size = 1
+        while True:
+            loaded(np.zeros((size,) + INPUT_SHAPE, dtype=np.uint8))
+            if size >= MAX_BATCH:
+                break
+            size *= 2
+        model = loaded
+        model_ready.set()
         print("✅ Model loaded")
+    except Exception as e:
+        print("⚠️ Model load failed:", e)
+
+def get_model():
+    if not model_ready.is_set():
+        # Restarts the loader if it failed or didn't survive a fork, then waits
+        # for that attempt only: a load that fails returns the 503 at once
+        ensure_background_thread(preload_model)
+        background_threads[preload_model].join(timeout=MODEL_LOAD_TIMEOUT)
+        if not model_ready.is_set():
+            raise ModelNotLoaded("CNN model is not loaded")
+    return model
+
+# Load at import so workers are warm before their first request. Under
+# gunicorn the master defers this and each forked worker loads its own copy.
+if not os.environ.get("DEFER_MODEL_LOAD"):
+    ensure_background_thread(preload_model)
+
+# ---------------- REQUEST BATCHING ----------------
+batch_queue = queue.Queue(maxsize=MAX_BATCH * MAX_QUEUED_BATCHES)
+
+def batch_worker():
+    # Inputs are gathered into one reused buffer; the model sees a view of it
+    batch_buffer = np.empty((MAX_BATCH,) + INPUT_SHAPE, dtype=np.uint8)
+    while True:
+        items = drain_queue(batch_queue, MAX_BATCH, MAX_WAIT_MS / 1000.0)
+        try:
+            batch = batch_buffer[:len(items)]
+            np.concatenate([x for x, _ in items], out=batch)
+            preds = model(batch)
+        except Exception as e:
+            for _, future in items:
+                future.set_exception(e)
+            continue
+
+        for i, (_, future) in enumerate(items):
+            future.set_result(preds[i])
+
+def run_batched(x):
+    # Wait out a cold start here rather than in the worker, so a slow load
+    # costs MODEL_LOAD_TIMEOUT and not PREDICT_TIMEOUT plus a stalled batch
+    get_model()
+    ensure_background_thread(batch_worker)
+    future = Future()
+    batch_queue.put_nowait((x, future))  # raises queue.Full when overloaded
+    return future.result(timeout=PREDICT_TIMEOUT)
+
+# ---------------- IMAGE HELPERS ----------------
+# Images are decoded with OpenCV and stay in its BGR order: the inference
+# backends flip the channels as part of scaling their input.
+def read_upload(file):
+    # Upload bytes without a copy (see UploadRequest). getvalue() rather than
+    # getbuffer(): a buffer export kept alive by an exception traceback would
+    # make closing the BytesIO at request teardown raise BufferError.
+    stream = file.stream
+    if isinstance(stream, io.BytesIO):
+        return stream.getvalue()
+    try:
+        return mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError, io.UnsupportedOperation):
+        return stream.read()  # empty or not file-backed
+
+# JPEG frame headers (SOF0-SOF15, minus DHT/JPG/DAC) carry the image size
+JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# Pixels are used as stored, like the PIL decoding this replaced: OpenCV
+# would otherwise apply the EXIF orientation tag and rotate phone photos
+IGNORE_ORIENTATION = cv2.IMREAD_IGNORE_ORIENTATION
+# libjpeg can decode straight from the DCT coefficients at 1/2, 1/4 or 1/8 scale
+JPEG_REDUCED_READS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8 | IGNORE_ORIENTATION),
+    (4, cv2.IMREAD_REDUCED_COLOR_4 | IGNORE_ORIENTATION),
+    (2, cv2.IMREAD_REDUCED_COLOR_2 | IGNORE_ORIENTATION),
+)
+
+def jpeg_size(data):
+    """(width, height) from a JPEG's frame header, or None if it isn't a JPEG."""
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:  # markers without a length
+            i += 2
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            return (data[i + 7] << 8) | data[i + 8], (data[i + 5] << 8) | data[i + 6]
+        i += 2 + ((data[i + 2] << 8) | data[i + 3])
+    return None
+
+def decode_flags(data):
+    # Large JPEGs (phone photos) are decoded at the smallest DCT scale that
+    # still leaves at least IMG_SIZE pixels for the area resize
+    size = jpeg_size(data)
+    if size:
+        for factor, flag in JPEG_REDUCED_READS:
+            if min(size) >= factor * max(IMG_SIZE):
+                return flag
+    return cv2.IMREAD_COLOR | IGNORE_ORIENTATION
+
+def decode_image(raw):
+    # Unlike PIL, most OpenCV builds have no GIF decoder, so GIF uploads get
+    # the same 400 as any other undecodable file
+    data = np.frombuffer(raw, dtype=np.uint8)
+    if data.size == 0:
+        return None
+    try:
+        return cv2.imdecode(data, decode_flags(raw))  # None if the bytes aren't an image
+    except cv2.error:
+        return None  # over OPENCV_IO_MAX_IMAGE_PIXELS
+
+# Per-thread model input buffer for preprocessing. A request thread blocks until
+# its batch has run, so its input buffer is never overwritten while queued.
+thread_buffers = threading.local()
+
+def get_thread_buffer():
+    if not hasattr(thread_buffers, "x"):
+        thread_buffers.x = np.empty((1,) + INPUT_SHAPE, dtype=np.uint8)
+    return thread_buffers.x
+
+def preprocess_image(img):
+    # SIMD area resampling straight into the reused (1, 224, 224, 3) input;
+    # channel order and scaling are handled inside each inference backend
+    x = get_thread_buffer()
+    cv2.resize(img, IMG_SIZE, dst=x[0], interpolation=cv2.INTER_AREA)
+    return x
+
+def decode_scores(scores):
+    # One conversion to Python floats, then a plain loop over the few classes;
+    # cheaper than separate numpy argmax/index/float calls on a tiny vector
+    scores = scores.tolist()
+    idx = max(range(len(scores)), key=scores.__getitem__)
+    return idx, scores[idx]
+
+# Degenerate inputs (thumbnails, blank or solid-colour frames, probes) are
+# answered as NotCoconut without running the CNN
+MIN_IMAGE_SIDE = 32  # pixels
+MIN_PIXEL_STD = 2.55  # per channel, in uint8 levels (variance 1e-4 on the [0, 1] scale)
+
+def rejected_prediction():
+    return {
+        "class_name": CLASSES[NOT_COCONUT_INDEX],
+        "lifespan": CLASS_LIFESPANS[NOT_COCONUT_INDEX],
+        "definition": CLASS_DEFINITIONS[NOT_COCONUT_INDEX],
+        "confidence": 0.0,
+        "is_valid": False
+    }
 
+def predict_image(img):
+    if min(img.shape[:2]) < MIN_IMAGE_SIDE:
+        return rejected_prediction()
     x = preprocess_image(img)
-    preds = model.predict(x, verbose=0)
-    idx = int(preds.argmax())
-    confidence = float(preds[0][idx])
-    label = CLASSES[idx]
+    # Solid-colour images are flat in every channel. meanStdDev reads the
+    # uint8 buffer directly instead of upcasting all of it to float64.
+    _, channel_std = cv2.meanStdDev(x[0])
+    if channel_std.max() < MIN_PIXEL_STD:
+        return rejected_prediction()
+    idx, confidence = decode_scores(run_batched(x))
 
-    # Always return prediction, even if low confidence
+    # Always return prediction, even if low confidence (without variety info).
+    # It is not a confirmed variety, so it is not valid and isn't saved.
     if confidence < CONFIDENCE_THRESHOLD:
-        label = f"Low Confidence: {label}"
-
-    # If label not in CLASS_INFO, return basic info
-    info = CLASS_INFO.get(label, {
-        "class_name": label,
-        "lifespan": "Unknown",
-        "definition": "No info available"
-    })
+        return {
+            "class_name": f"Low Confidence: {CLASSES[idx]}",
+            "lifespan": UNKNOWN_INFO["lifespan"],
+            "definition": UNKNOWN_INFO["definition"],
+            "confidence": round(confidence, 4),
+            "is_valid": False
+        }
 
     return {
-        "class_name": info["class_name"],
-        "lifespan": info["lifespan"],
-        "definition": info["definition"],
+        "class_name": CLASSES[idx],
+        "lifespan": CLASS_LIFESPANS[idx],
+        "definition": CLASS_DEFINITIONS[idx],
         "confidence": round(confidence, 4),
-        "is_valid": label not in ["NotCoconut", "Unknown Dwarf Variety", "Unknown Tall Variety"]
+        "is_valid": CLASS_IS_VALID[idx]
     }
 
+# ---------------- PREDICTION CACHE ----------------
+# Clients retry uploads, so identical bytes are answered from an LRU keyed
+# by a hash of the upload instead of running the CNN again.
+PREDICTION_CACHE_SIZE = int(os.environ.get("PREDICTION_CACHE_SIZE", 4096))
+
+prediction_cache = OrderedDict()
+prediction_cache_lock = threading.Lock()
+
+def cached_prediction(key):
+    with prediction_cache_lock:
+        result = prediction_cache.get(key)
+        if result is not None:
+            prediction_cache.move_to_end(key)
+        return result
+
+def cache_prediction(key, result):
+    with prediction_cache_lock:
+        prediction_cache[key] = result
+        prediction_cache.move_to_end(key)
+        while len(prediction_cache) > PREDICTION_CACHE_SIZE:
+            prediction_cache.popitem(last=False)
+
+def predict_upload(file):
+    """Prediction for an uploaded image file, or None if it isn't an image."""
+    raw = read_upload(file)
+    key = hashlib.blake2b(raw, digest_size=16).digest()
+    result = cached_prediction(key)
+    if result is None:
+        img = decode_image(raw)
+        if img is None:
+            return None
+        result = predict_image(img)
+        cache_prediction(key, result)
+    return dict(result)  # callers add per-request fields
+
+# ---------------- PAGES ----------------
+# The pages are plain HTML (no template variables), so they are read once
+# and served as bytes with an ETag; repeat visits get a 304.
+PAGES = ("index.html", "register.html", "dashboard.html", "admin.html")
+PAGE_MAX_AGE = 3600
+
+def load_page(name):
+    with open(os.path.join(TEMPLATE_DIR, name), "rb") as f:
+        body = f.read()
+    return body, hashlib.md5(body).hexdigest()
+
+page_cache = {name: load_page(name) for name in PAGES}
+
+def page_response(name):
+    body, etag = page_cache[name]
+    response = Response(body, mimetype="text/html")
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = PAGE_MAX_AGE
+    return response.make_conditional(request)
+
 # ---------------- ROUTES ----------------
 @app.route("/")
 def index():
-    return render_template("index.html")
+    return page_response("index.html")
+
+# The front-end navigates between pages by file name (e.g. "dashboard.html").
+# Each page gets its own rule, so other paths (e.g. GET /predict) keep
+# Flask's normal 404/405 handling.
+for name in PAGES:
+    app.add_url_rule("/" + name, endpoint=name, view_func=lambda name=name: page_response(name))
 
 @app.route("/predict", methods=["POST"])
 def predict():
-    img = None
-    location = None
-
     # JSON input (optional)
     if request.is_json:
         data = request.get_json()
         location = data.get("location", "Unknown")
         class_name = data.get("class_name")
         if class_name:
-            info = CLASS_INFO.get(class_name, {
-                "class_name": class_name,
-                "lifespan": "Unknown",
-                "definition": "No info available"
-            })
+            info = CLASS_INFO.get(class_name, {"class_name": class_name, **UNKNOWN_INFO})
             is_valid = class_name in CLASS_INFO
             result = {
                 "class_name": info["class_name"],
@@ -148,33 +662,26 @@ def predict():
                 "confidence": 1.0 if is_valid else 0.0,
                 "is_valid": is_valid
             }
-            if db and is_valid:
-                try:
-                    db.collection("CoconutPredictions").add(result)
-                except Exception as e:
-                    print("⚠️ Firestore write failed:", e)
+            if is_valid:
+                save_prediction(result)
             return jsonify(result)
 
     # File upload
-    if "image" in request.files:
-        img = load_image_from_file(request.files["image"])
-        location = request.form.get("location", "Unknown")
-
-    if img is None:
+    if "image" not in request.files:
         return jsonify({"error": "No image provided"}), 400
 
-    result = predict_image(img)
-    result["location"] = location
+    result = predict_upload(request.files["image"])
+    if result is None:
+        return jsonify({"error": "Invalid image file"}), 400
+    result["location"] = request.form.get("location", "Unknown")
 
-    if db and result.get("is_valid", False):
-        try:
-            db.collection("CoconutPredictions").add(result)
-        except Exception as e:
-            print("⚠️ Firestore write failed:", e)
+    if result.get("is_valid", False):
+        save_prediction(result)
 
     return jsonify(result)
 
 # ---------------- RUN ----------------
+# Development server only; production runs under gunicorn (see Procfile)
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
     print(f"🚀 Server running on port {port}")